@@ -33,27 +33,26 @@ setup(
     test_suite="tests",
     install_requires=[
         'fastapi',
-        'uvicorn',
+        'orjson',
+        'uvicorn[standard]>=0.20',
         'gunicorn',
         'ksuid',
         'pydantic',
         'numpy',
         'nltk',
+        'blingfire',
         'transformers',
-        'termcolor',
         'sentence-transformers',
         'starlette',
         'python-multipart',
-        'whisper-ai',
-        'moviepy',
+        'faster-whisper>=1.1.0',
         'mutagen',
-        'PyPDF2',
-        'uvloop',
+        'pypdf',
         'boto3',
         'pydub',
         'jwt',
         'python-jose',
-        'pinecone-client',
+        'pinecone-client[grpc]',
         'python-dotenv',
         'pdf2image',
         'python-magic',
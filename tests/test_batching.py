@@ -0,0 +1,82 @@
+import threading
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from weaver.utils.batching import EncodeBatcher
+
+def test_encode_batcher_returns_row_per_caller():
+    batcher = EncodeBatcher(lambda texts: [text.upper() for text in texts])
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(batcher.encode, [f"query {i}" for i in range(20)]))
+    assert results == [f"QUERY {i}" for i in range(20)]
+
+def test_encode_batcher_coalesces_concurrent_requests():
+    batch_sizes = []
+    def encoder(texts):
+        batch_sizes.append(len(texts))
+        return texts
+    batcher = EncodeBatcher(encoder, max_batch=4, max_wait=0.2)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(batcher.encode, ["a", "b", "c", "d"]))
+    assert max(batch_sizes) > 1
+    assert all(size <= 4 for size in batch_sizes)
+
+def test_encode_batcher_propagates_errors():
+    def encoder(texts):
+        raise ValueError("model failure")
+    batcher = EncodeBatcher(encoder)
+    try:
+        batcher.encode("query")
+        assert False, "expected the encoder error to be raised"
+    except ValueError as e:
+        assert str(e) == "model failure"
+
+def test_encode_batcher_encode_many_preserves_order():
+    batcher = EncodeBatcher(lambda texts: [len(text) for text in texts], max_batch=3)
+    texts = ["a" * i for i in range(10)]
+    assert batcher.encode_many(texts) == list(range(10))
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.001)
+    return False
+
+def test_encode_batcher_takes_single_texts_first():
+    started = threading.Event()
+    release = threading.Event()
+    batches = []
+    def encoder(texts):
+        batches.append(list(texts))
+        if len(batches) == 1:
+            started.set()
+            release.wait(5)
+        return texts
+    batcher = EncodeBatcher(encoder, max_batch=2, max_wait=0)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        first = executor.submit(batcher.encode, "first")
+        assert started.wait(5)
+        # The worker is blocked on the first batch, so everything below stays queued until release
+        upload = executor.submit(batcher.encode_many, ["chunk 1", "chunk 2", "chunk 3", "chunk 4"])
+        assert wait_until(lambda: batcher._queue.qsize() == 4)
+        query = executor.submit(batcher.encode, "query")
+        assert wait_until(lambda: batcher._queue.qsize() == 5)
+        release.set()
+        assert query.result(5) == "query"
+        assert upload.result(5) == ["chunk 1", "chunk 2", "chunk 3", "chunk 4"]
+        first.result(5)
+    assert batches[1][0] == "query"
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_encode_batcher_fails_waiters_when_worker_stops():
+    def encoder(texts):
+        raise SystemExit
+    batcher = EncodeBatcher(encoder)
+    try:
+        batcher.encode("query")
+        assert False, "expected the waiting caller to be failed"
+    except RuntimeError:
+        pass
+    batcher._thread.join(5)
@@ -1,5 +1,11 @@
 from fastapi.testclient import TestClient
 from weaver.app import app
+from weaver.routers.upload import decode_audio
+import subprocess
+import shutil
+import random
+from concurrent.futures import ThreadPoolExecutor
+import pytest
 import os
 import io
 
@@ -42,4 +48,16 @@ def test_upload_endpoint_file_size_limit():
 def test_upload_endpoint_missing_file():
     response = client.post("/upload/", headers={"Authorization": f"Bearer {os.getenv('BEARER_TOKEN')}"})
     assert response.status_code == 422
-    assert "detail" in response.json()
\ No newline at end of file
+    assert "detail" in response.json()
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+def test_decode_audio_rejects_corrupt_mp3():
+    # Several MiB of noise makes ffmpeg fail, and keeps stdin busy long enough that a stalled
+    # stderr pipe would hang the call; the timeout turns a hang into a failure
+    garbage = io.BytesIO(random.Random(0).randbytes(8 * 1024 * 1024))
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        with pytest.raises(subprocess.CalledProcessError):
+            executor.submit(decode_audio, garbage).result(timeout=60)
+    finally:
+        executor.shutdown(wait=False)
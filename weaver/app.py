@@ -1,17 +1,30 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from uvicorn import run
+import asyncio
 import os
+import sys
 from .routers import search, upload, download
 from .version import __version__
-from .config import publish_sns_notification
+from .config import logger, publish_sns_notification, check_system_dependencies, preload_models, load_models
 
 try:
     import uvloop
+    # Install the policy at import so every loop created in this process, not just uvicorn's
+    # own, runs on uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     loop = "uvloop"
 except ImportError:
     loop = "asyncio"
 
+try:
+    import httptools
+    http = "httptools"
+except ImportError:
+    http = "h11"
+
 description = """
 Textweaver helps you search your files and a treasure trove of cybersecurity information. 🚀
 
@@ -46,7 +59,8 @@ app = FastAPI(
     },
     docs_url="/docs",
     redoc_url="/redocs",
-    openapi_tags=None
+    openapi_tags=None,
+    default_response_class=ORJSONResponse
 )
 
 origins = [
@@ -61,10 +75,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class JSONGZipMiddleware(GZipMiddleware):
+    # File downloads (POST /downloads/{username}/{file_key}) stream stored PDFs, MP3s and MP4s
+    # that are already compressed; gzipping them again only costs CPU and drops Content-Length
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"].startswith("/downloads/"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+# Compress search results and other JSON bodies; small responses are sent as-is, and level 5
+# keeps most of the size reduction at a fraction of level 9's CPU cost
+app.add_middleware(JSONGZipMiddleware, minimum_size=1024, compresslevel=5)
+
+# Load the models before gunicorn forks its workers so they share one copy of the weights
+if os.getenv("PRELOAD_MODELS", "false").lower() == "true":
+    preload_models()
+
 def start_app():
-    host_ip = os.getenv("HOST_IP") or input("Enter host IP: ")
-    port_num = int(os.getenv("PORT") or input("Enter port number: "))
-    run(app, host=host_ip, port=port_num, loop=loop)  # Set max request body size to 600 MB for uvicorn
+    host_ip = os.getenv("HOST_IP")
+    port_num = os.getenv("PORT")
+    if not host_ip or not port_num:
+        logger.error("HOST_IP and PORT must be set in the environment or the .env file.")
+        sys.exit(1)
+    port_num = int(port_num)
+    # Each worker loads its own copy of the models, so the default stays at one
+    workers = int(os.getenv("WORKERS", 1))
+    # Pass the app as an import string so uvicorn can import it in every worker process
+    run(
+        "weaver.app:app",
+        host=host_ip,
+        port=port_num,
+        loop=loop,
+        http=http,
+        workers=workers,
+        backlog=2048,
+        limit_concurrency=1000,
+        timeout_keep_alive=30
+    )
 
 app.include_router(search.router)
 app.include_router(upload.router)
@@ -75,9 +123,27 @@ def read_health():
     return {"status": "healthy"}
 
 @app.on_event("startup")
-def startup_event():
-    publish_sns_notification("Stinkbait server has started.", "Stinkbait Startup")
+async def startup_event():
+    check_system_dependencies()
+    # Announce the start without holding readiness on the SNS round-trip
+    app.state.startup_notification = asyncio.create_task(
+        asyncio.to_thread(publish_sns_notification, "Stinkbait server has started.", "Stinkbait Startup")
+    )
+
+def warm_models():
+    try:
+        load_models()
+        logger.info("Models warmed")
+    except Exception as e:
+        logger.error(f"Error warming models: {e}")
+
+@app.on_event("startup")
+async def warm_models_event():
+    # Load the models in the background so the worker answers /health while they load;
+    # a request that needs a model first waits on the same single load
+    app.state.model_warmup = asyncio.create_task(asyncio.to_thread(warm_models))
 
 @app.on_event("shutdown")
-def shutdown_event():
-    publish_sns_notification("Stinkbait server has shut down.", "Stinkbait Shutdown")
\ No newline at end of file
+async def shutdown_event():
+    # Still awaited so the notification goes out before the worker exits, but off the event loop
+    await asyncio.to_thread(publish_sns_notification, "Stinkbait server has shut down.", "Stinkbait Shutdown")
\ No newline at end of file
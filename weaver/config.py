@@ -1,18 +1,30 @@
 import os
-import subprocess
-import platform
+import copy
+import shutil
 import sys
 import logging
 import pinecone
-import whisper
 import boto3
 import nltk
+import torch
+import hashlib
+import threading
+import queue
+from collections import OrderedDict
 from botocore.exceptions import ClientError
-from typing import Optional
-from transformers import BertTokenizer
+from functools import lru_cache, wraps
+from typing import List, Optional
+from transformers import PreTrainedTokenizerBase
 from sentence_transformers import SentenceTransformer
-from termcolor import colored
+from faster_whisper import WhisperModel, BatchedInferencePipeline
 from dotenv import load_dotenv
+from .utils.batching import EncodeBatcher
+
+# The gRPC index sends vectors as packed binary floats instead of JSON text
+try:
+    from pinecone import GRPCIndex as PineconeIndex
+except ImportError:
+    from pinecone import Index as PineconeIndex
 
 
 ##############################################################################################
@@ -20,26 +32,33 @@ from dotenv import load_dotenv
 ##############################################################################################
 
 class ColoredConsoleHandler(logging.StreamHandler):
+    # ANSI escape codes per level, built once instead of per record
     COLORS = {
-        'DEBUG': 'blue',
-        'INFO': 'green',
-        'WARNING': 'yellow',
-        'ERROR': 'red',
-        'CRITICAL': 'magenta',
+        'DEBUG': '\033[34m',  # blue
+        'INFO': '\033[32m',  # green
+        'WARNING': '\033[33m',  # yellow
+        'ERROR': '\033[31m',  # red
+        'CRITICAL': '\033[35m',  # magenta
     }
+    RESET = '\033[0m'
 
-    def emit(self, record):
-        log_message = self.format(record)
-        color = self.COLORS.get(record.levelname, 'white')
-        print(colored(log_message, color))
+    def __init__(self, stream=None):
+        super().__init__(stream)
+        # Only color output that goes to a terminal, so redirected logs stay plain text
+        self.colorize = hasattr(self.stream, 'isatty') and self.stream.isatty()
 
-# Create a logger
+    def format(self, record):
+        log_message = super().format(record)
+        color = self.COLORS.get(record.levelname) if self.colorize else None
+        return f"{color}{log_message}{self.RESET}" if color else log_message
+
+# Create a logger; records below INFO are dropped before any handler formats them
 logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
+logger.setLevel(logging.INFO)
 
 
 # Create the colored console handler
-console_handler = ColoredConsoleHandler()
+console_handler = ColoredConsoleHandler(sys.stdout)
 console_handler.setLevel(logging.INFO)  # Set level for the console handler
 
 formatter = logging.Formatter('%(asctime)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
@@ -51,33 +70,37 @@ logger.addHandler(console_handler)
 ##############################################################################################
 ###                          Environment Variables Configuration                           ###
 ##############################################################################################
-# Load environment variables from .env file
-env_file = False
-try:
-    env_file=load_dotenv('.env')
-except Exception as e:
-    logger.error(f"Error loading environment variables: {e}")
+# Load environment variables from .env file; worker processes inherit the parent's environment,
+# so the file is only read and parsed once
+env_file = bool(os.getenv('WEAVER_ENV_LOADED'))
+if not env_file:
+    try:
+        env_file=load_dotenv('.env')
+    except Exception as e:
+        logger.error(f"Error loading environment variables: {e}")
+    if env_file:
+        os.environ['WEAVER_ENV_LOADED'] = '1'
+required_env_vars = frozenset({
+    'HOST_IP',
+    'PORT',
+    'AWS_ACCESS_KEY_ID',
+    'AWS_SECRET_ACCESS_KEY',
+    'AWS_DEFAULT_REGION',
+    'AWS_COGNITO_REGION',
+    'AWS_USER_POOL_ID',
+    'AWS_USER_POOL_CLIENT_ID',
+    'SNS_TOPIC_NAME',
+    'PINECONE_API_KEY',
+    'PINECONE_ENVIRONMENT',
+    'PINECONE_INDEX_NAME',
+    'PINECONE_USER_INDEX_NAME',
+    'MODEL_PATH'
+})
 if env_file is False:
-    logger.error("Environment file not found. Checking if environment variables are already loaded.")
-    required_env_vars = [
-        'HOST_IP',
-        'PORT',
-        'AWS_ACCESS_KEY_ID',
-        'AWS_SECRET_ACCESS_KEY',
-        'AWS_DEFAULT_REGION',
-        'AWS_COGNITO_REGION',
-        'AWS_USER_POOL_ID',
-        'AWS_USER_POOL_CLIENT_ID',
-        'SNS_TOPIC_NAME',
-        'PINECONE_API_KEY',
-        'PINECONE_ENVIRONMENT',
-        'PINECONE_INDEX_NAME',
-        'PINECONE_USER_INDEX_NAME',
-        'MODEL_PATH'
-    ]
-    missing_env_vars = [var for var in required_env_vars if os.getenv(var) is None]
+    logger.warning("Environment file not found. Checking if environment variables are already loaded.")
+    missing_env_vars = required_env_vars.difference(os.environ)
     if missing_env_vars:
-        logger.error(f"Missing environment variables: {', '.join(missing_env_vars)}. Please set them or create a .env file in the current working directory.")
+        logger.error(f"Missing environment variables: {', '.join(sorted(missing_env_vars))}. Please set them or create a .env file in the current working directory.")
         sys.exit(1)
 
 ##############################################################################################
@@ -100,28 +123,111 @@ aws_session = boto3.Session(
     region_name=default_region
 )
 
-# Create a boto3 Textract client using the session
-textract_client = aws_session.client('textract')
+@lru_cache(maxsize=None)
+def get_client(service: str):
+    """
+    Return the boto3 client for a service on the shared session, building it on first use.
+    Clients are thread-safe and expensive to build, so every module reuses the same one.
+    """
+    return aws_session.client(service)
+
+sns_topic_arn = f"arn:aws:sns:us-east-1:502534243523:{os.getenv('SNS_TOPIC_NAME')}"
 
 def publish_sns_notification(info: str, subject: Optional[str] = None) -> Optional[str]:
     try:
-        sns_client = aws_session.client('sns')
-        topic_arn = f"arn:aws:sns:us-east-1:502534243523:{os.getenv('SNS_TOPIC_NAME')}"
         message = info
-        publish_args = {"TopicArn": topic_arn, "Message": message}
+        publish_args = {"TopicArn": sns_topic_arn, "Message": message}
         if subject is not None:
             publish_args["Subject"] = subject
-        response = sns_client.publish(**publish_args)
+        response = get_client('sns').publish(**publish_args)
         return response.get("MessageId")
     except ClientError as e:
         print(f"Failed to publish SNS message: {e}")
         return None
 
+def publish_sns_notifications(messages: List[str], subject: Optional[str] = None) -> None:
+    """
+    Publish up to 10 messages (the SNS batch limit) in a single request.
+    """
+    entries = []
+    for i, message in enumerate(messages):
+        entry = {"Id": str(i), "Message": message}
+        if subject is not None:
+            entry["Subject"] = subject
+        entries.append(entry)
+    try:
+        response = get_client('sns').publish_batch(TopicArn=sns_topic_arn, PublishBatchRequestEntries=entries)
+        for failed in response.get("Failed", []):
+            print(f"Failed to publish SNS message: {failed.get('Message')}")
+    except ClientError as e:
+        print(f"Failed to publish SNS messages: {e}")
+
 # Create a logging handler that publishes to SNS
 class SNSNotificationHandler(logging.Handler):
+    """
+    Publishes records to SNS from a background thread, so the thread that logged an error
+    never waits on the network. Records queued together go out in one batch request.
+    """
+    max_batch = 10
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
     def emit(self, record):
-        log_entry = self.format(record)
-        publish_sns_notification(log_entry, subject="Stinkbait Error")
+        try:
+            self._queue.put_nowait(self.format(record))
+            self._ensure_started()
+        except Exception:
+            self.handleError(record)
+
+    def _ensure_started(self) -> None:
+        # Started lazily so the publisher thread belongs to the process that logs
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sns-publisher", daemon=True)
+                self._thread.start()
+
+    def flush(self) -> None:
+        # Publish whatever is still queued from the calling thread, then wait for the batch the
+        # publisher thread has in flight; logging.shutdown calls this at exit, so errors logged
+        # right before sys.exit are still delivered
+        while True:
+            messages = self._take_batch(block=False)
+            if not messages:
+                break
+            self._publish(messages)
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def close(self) -> None:
+        self.flush()
+        super().close()
+
+    def _take_batch(self, block: bool) -> List[str]:
+        messages = [self._queue.get()] if block else []
+        while len(messages) < self.max_batch:
+            try:
+                messages.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return messages
+
+    def _publish(self, messages: List[str]) -> None:
+        try:
+            publish_sns_notifications(messages, subject="Stinkbait Error")
+        except Exception as e:
+            # Printed rather than logged, which would feed the error back into this handler
+            print(f"Failed to publish SNS messages: {e}")
+        finally:
+            for _ in messages:
+                self._queue.task_done()
+
+    def _run(self) -> None:
+        while True:
+            self._publish(self._take_batch(block=True))
 
 sns_handler = SNSNotificationHandler()
 sns_handler.setLevel(logging.ERROR)
@@ -129,15 +235,126 @@ logger.addHandler(sns_handler)
 ##############################################################################################
 ##                            Embedding Model and Tokenizer                                 ##
 ##############################################################################################
-model = SentenceTransformer(f"{os.getenv('MODEL_PATH')}")
-tokenizer = BertTokenizer.from_pretrained('bert-base-uncased')
+# Number of texts sent through the embedding model per forward pass
+embedding_batch_size = int(os.getenv('EMBEDDING_BATCH_SIZE', 32))
+
+def load_once(loader):
+    """
+    Cache the result of a zero-argument model loader. Unlike a bare lru_cache, concurrent
+    first calls (a background warm-up and an early request) wait for a single load
+    instead of each loading its own copy.
+    """
+    lock = threading.Lock()
+    cached_loader = lru_cache(maxsize=1)(loader)
+
+    @wraps(loader)
+    def wrapper():
+        with lock:
+            return cached_loader()
+    wrapper.cache_clear = cached_loader.cache_clear
+    return wrapper
+
+# Models are loaded on first use, once per process, so importing this module stays cheap
+@load_once
+def get_embedding_model() -> SentenceTransformer:
+    backend = os.getenv('MODEL_BACKEND', 'torch').lower()
+    if backend != 'torch':
+        # ONNX Runtime / OpenVINO run a fused, exported graph; the model is exported on first
+        # load unless MODEL_PATH already contains the exported files
+        model = SentenceTransformer(f"{os.getenv('MODEL_PATH')}", backend=backend)
+        logger.info(f'Embedding model loaded with the {backend} backend')
+        return model
+
+    # Pick the device once instead of leaving sentence-transformers to detect it
+    if torch.cuda.is_available():
+        device = 'cuda'
+    elif torch.backends.mps.is_available():
+        device = 'mps'
+    else:
+        device = 'cpu'
+    model = SentenceTransformer(f"{os.getenv('MODEL_PATH')}", device=device)
+    # Run the encoder in half precision on GPU; encode() already runs in eval mode without autograd
+    if device != 'cpu':
+        model.half()
+    elif os.getenv('MODEL_QUANTIZE', 'false').lower() == 'true':
+        # Dynamic int8 quantization of the Linear layers uses int8 GEMM kernels on CPU
+        model[0].auto_model = torch.quantization.quantize_dynamic(model[0].auto_model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    # Optionally compile the transformer to fuse ops; batches are padded to their longest
+    # input, so shapes vary and the graph is compiled with dynamic shapes
+    if os.getenv('MODEL_COMPILE', 'false').lower() == 'true' and hasattr(torch, 'compile'):
+        model[0].auto_model = torch.compile(model[0].auto_model, dynamic=True)
+        # Warm up with short and long inputs so requests don't pay the compile cost
+        model.encode(["query: warmup", "passage: " + "warmup " * 200], show_progress_bar=False)
+        logger.info('Embedding model compiled')
+    logger.info(f'Embedding model loaded on {device}')
+    return model
+
+# All embedding work in the process (queries and uploaded passages) is coalesced into
+# shared batches on one thread, which also keeps concurrent requests off the model
+embedding_batcher = EncodeBatcher(
+    lambda texts: get_embedding_model().encode(texts, batch_size=embedding_batch_size, convert_to_numpy=True, show_progress_bar=False),
+    max_batch=embedding_batch_size
+)
+
+# In-process LRU cache of embeddings keyed by a hash of the exact text sent to the model
+embedding_cache_size = 10000
+_embedding_cache = OrderedDict()
+_embedding_cache_lock = threading.Lock()
+
+def encode_cached(texts):
+    """
+    Encode a list of texts, reusing cached embeddings and batching only the cache misses through the model.
+
+    Parameters:
+        texts (list): The exact strings to embed, including any instruction prefix.
+
+    Returns:
+        list: One embedding (numpy array) per input text, in input order.
+    """
+    keys = [hashlib.blake2b(text.encode(), digest_size=16).hexdigest() for text in texts]
+    embeddings = [None] * len(texts)
+    misses = {}
+    with _embedding_cache_lock:
+        for i, key in enumerate(keys):
+            cached = _embedding_cache.get(key)
+            if cached is not None:
+                _embedding_cache.move_to_end(key)
+                embeddings[i] = cached
+            else:
+                misses.setdefault(key, texts[i])
+
+    if misses:
+        encoded = embedding_batcher.encode_many(list(misses.values()))
+        fresh = dict(zip(misses.keys(), encoded))
+        with _embedding_cache_lock:
+            for key, embedding in fresh.items():
+                _embedding_cache[key] = embedding
+                _embedding_cache.move_to_end(key)
+            while len(_embedding_cache) > embedding_cache_size:
+                _embedding_cache.popitem(last=False)
+        for i, key in enumerate(keys):
+            if embeddings[i] is None:
+                embeddings[i] = fresh[key]
+    return embeddings
+
+@load_once
+def get_tokenizer() -> PreTrainedTokenizerBase:
+    # Count chunk tokens with the embedding model's own tokenizer so chunks match what the model
+    # sees. It is a separate copy because encode() changes the truncation settings of the
+    # tokenizer it uses, which a Rust tokenizer rejects while another thread is using it
+    return copy.deepcopy(get_embedding_model().tokenizer)
 
 try:
-    nltk.download('punkt')
-    logger.info('Punkt dataset downloaded')
-except Exception as e:
-    logger.error(f"Error downloading NLTK punkt: {e}")
-    sys.exit(1)
+    # nltk.download checks the remote index on every call; only fetch punkt when it is missing
+    nltk.data.find('tokenizers/punkt')
+except LookupError:
+    try:
+        nltk.download('punkt', quiet=True)
+        logger.info('Punkt dataset downloaded')
+    except Exception as e:
+        logger.error(f"Error downloading NLTK punkt: {e}")
+        sys.exit(1)
 ##############################################################################################
 ###                                  DB Connection Configuration                           ###                    
 ##############################################################################################
@@ -145,191 +362,74 @@ except Exception as e:
 # Pinecone connection parameters
 PINECONE_API_KEY = os.environ.get('PINECONE_API_KEY')
 PINECONE_ENV = os.environ.get('PINECONE_ENVIRONMENT')
-pinecone.init(
-    api_key=PINECONE_API_KEY,
-    environment=PINECONE_ENV
-)
-try:
-    idx = pinecone.Index(os.getenv('PINECONE_INDEX_NAME'))
-except Exception as e:
-    logger.error(f"Error connecting to Pinecone: {e}")
-    sys.exit(1)
-
-try:
-    user_idx = pinecone.Index(os.getenv('PINECONE_USER_INDEX_NAME'))
-except Exception as e:
-    logger.error(f"Error connecting to Pinecone: {e}")
-    sys.exit(1)
+PINECONE_INDEX_NAME = os.getenv('PINECONE_INDEX_NAME')
+PINECONE_USER_INDEX_NAME = os.getenv('PINECONE_USER_INDEX_NAME')
+
+@load_once
+def init_pinecone() -> None:
+    pinecone.init(
+        api_key=PINECONE_API_KEY,
+        environment=PINECONE_ENV
+    )
+
+@lru_cache(maxsize=None)
+def get_index(name: str) -> PineconeIndex:
+    """
+    Return the handle for a Pinecone index, connecting on first use. Handles are reused for
+    the life of the process, so workers that never query or upsert never open a connection.
+    """
+    init_pinecone()
+    return PineconeIndex(name)
 ##############################################################################################
 ###                                  Whisper AI Configuration                              ###
 ##############################################################################################
 
-def install_ffmpeg():
-    """
-    Check if ffmpeg is installed on the host system.
-    If not, it attempts to install it using the appropriate package manager.
-    """
+# Number of VAD segments of one recording transcribed per forward pass
+whisper_batch_size = int(os.getenv('WHISPER_BATCH_SIZE', 16))
+# Number of recordings transcribed at the same time
+whisper_workers = int(os.getenv('WHISPER_WORKERS', 1))
 
-    # Check if ffmpeg is installed
-    try:
-        subprocess.run(["ffmpeg", "-version"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        logger.info("ffmpeg is already installed.")
-    except FileNotFoundError:
-        logger.info("ffmpeg not found. Installing now...")
+@load_once
+def get_whisper_model() -> BatchedInferencePipeline:
+    # CTranslate2 backend: int8 weights with FP16 compute on GPU, int8 on CPU
+    if torch.cuda.is_available():
+        whisper_model = WhisperModel("base", device="cuda", compute_type="int8_float16")
+    else:
+        whisper_model = WhisperModel("base", device="cpu", compute_type="int8")
+    logger.info('Whisper model loaded')
+    # Splits audio on voice activity and decodes the segments in batches
+    return BatchedInferencePipeline(model=whisper_model)
 
-        # Determine the package manager (apt or yum) and install ffmpeg
-        try:
-            subprocess.run(["apt", "-v"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            subprocess.run(["apt-get", "update", "-y"], check=True)
-            subprocess.run(["apt-get", "upgrade", "-y"], check=True)
-            subprocess.run(["apt", "install", "ffmpeg", "-y"], check=True)
-            logger.info("ffmpeg installed successfully using apt.")
-        except FileNotFoundError:
-            try:
-                subprocess.run(["yum", "--version"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                if os.geteuid() == 0:
-                    subprocess.run(["yum", "install", "ffmpeg", "-y"], check=True)
-                else:
-                    subprocess.run(["sudo", "yum", "install", "ffmpeg", "-y"], check=True)
-                logger.info("ffmpeg installed successfully using yum.")
-            except FileNotFoundError:
-                logger.error("Could not determine package manager. Please install ffmpeg manually.")
-                sys.exit(1)
-
-# Call the function at startup to ensure ffmpeg is installed
-install_ffmpeg()
-whisper_model = whisper.load_model("base")
+def load_models():
+    """
+    Load every model into this process; models that are already loaded are reused.
+    """
+    get_embedding_model()
+    get_tokenizer()
+    get_whisper_model()
 
-##############################################################################################
-###                                 Poppler Configuration                                  ###
-##############################################################################################
-def is_poppler_installed():
-    try:
-        result = subprocess.run(["pdftoppm", "-v"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        if result.returncode == 0:
-            return True
-        else:
-            return False
-    except FileNotFoundError:
-        return False
-
-def install_poppler():
-    os_type = platform.system()
-    
-    if os_type == "Darwin":  # macOS
-        logger.info("Installing Poppler on macOS...")
-        try:
-            subprocess.run(["brew", "install", "poppler"], check=True)
-        except subprocess.CalledProcessError:
-            logger.info("Failed to install Poppler. Do you have Homebrew installed?")
-            return False
-
-    elif os_type == "Linux":
-        logger.info("Installing Poppler on Linux...")
-        # Detect package manager (apt, dnf, or zypper)
-        try:
-            subprocess.run(["apt-get", "-v"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            if os.geteuid() == 0:
-                subprocess.run(["apt-get", "update", "-y"], check=True)
-                subprocess.run(["apt-get", "install", "poppler-utils", "-y"], check=True)
-            else:
-                subprocess.run(["sudo", "apt-get", "update", "-y"], check=True)
-                subprocess.run(["sudo", "apt-get", "install", "poppler-utils", "-y"], check=True)
-        except (FileNotFoundError, subprocess.CalledProcessError):
-            try:
-                subprocess.run(["dnf", "--version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                if os.geteuid() == 0:
-                    subprocess.run(["dnf", "install", "poppler-utils", "-y"], check=True)
-                else:
-                    subprocess.run(["sudo", "dnf", "install", "poppler-utils", "-y"], check=True)
-            except (FileNotFoundError, subprocess.CalledProcessError):
-                try:
-                    subprocess.run(["zypper", "--version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                    if os.geteuid() == 0:
-                        subprocess.run(["zypper", "install", "poppler-tools", "-y"], check=True)
-                    else:
-                        subprocess.run(["sudo", "zypper", "install", "poppler-tools", "-y"], check=True)
-                except (FileNotFoundError, subprocess.CalledProcessError):
-                    logger.info("Failed to detect a supported package manager (apt, dnf, zypper).")
-                    return False
-    else:
-        logger.info("Unsupported operating system.")
-        return False
-    
-    return True
-
-# Run the functions directly upon import
-if not is_poppler_installed():
-    if install_poppler():
-        logger.info("Poppler has been successfully installed.")
-    else:
-        logger.info("Failed to install Poppler.")
-else:
-    logger.info("Poppler is already installed. No action needed.")
+def preload_models():
+    """
+    Load every model up front. Called in a gunicorn master started with --preload so the
+    forked workers share the CPU weights copy-on-write instead of loading their own copies.
+    """
+    if torch.cuda.is_available():
+        # A CUDA context created before fork() is unusable in the children
+        logger.warning("Skipping model preload: models on CUDA must be loaded in each worker.")
+        return
+    load_models()
 
 ##############################################################################################
-###                                Libmagic Configuration                                  ###
+###                                 System Dependencies                                    ###
 ##############################################################################################
-def is_libmagic_installed():
-    try:
-        result = subprocess.run(["file", "--version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        if result.returncode == 0:
-            return True
-        else:
-            return False
-    except FileNotFoundError:
-        return False
-
-def install_libmagic():
-    os_type = platform.system()
-    
-    if os_type == "Darwin":  # macOS
-        logger.info("Installing libmagic on macOS...")
-        try:
-            subprocess.run(["brew", "install", "libmagic"], check=True)
-        except subprocess.CalledProcessError:
-            logger.info("Failed to install libmagic. Do you have Homebrew installed?")
-            return False
-
-    elif os_type == "Linux":
-        logger.info("Installing libmagic on Linux...")
-        # Detect package manager (apt, dnf, or zypper)
-        try:
-            subprocess.run(["apt-get", "-v"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            if os.geteuid() == 0:
-                subprocess.run(["apt-get", "update", "-y"], check=True)
-                subprocess.run(["apt-get", "install", "libmagic1", "-y"], check=True)
-            else:
-                subprocess.run(["sudo", "apt-get", "update", "-y"], check=True)
-                subprocess.run(["sudo", "apt-get", "install", "libmagic1", "-y"], check=True)
-        except (FileNotFoundError, subprocess.CalledProcessError):
-            try:
-                subprocess.run(["dnf", "--version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                if os.geteuid() == 0:
-                    subprocess.run(["dnf", "install", "file-libs", "-y"], check=True)
-                else:
-                    subprocess.run(["sudo", "dnf", "install", "file-libs", "-y"], check=True)
-            except (FileNotFoundError, subprocess.CalledProcessError):
-                try:
-                    subprocess.run(["zypper", "--version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                    if os.geteuid() == 0:
-                        subprocess.run(["zypper", "install", "file", "-y"], check=True)
-                    else:
-                        subprocess.run(["sudo", "zypper", "install", "file", "-y"], check=True)
-                except (FileNotFoundError, subprocess.CalledProcessError):
-                    logger.info("Failed to detect a supported package manager (apt, dnf, zypper).")
-                    return False
-    else:
-        logger.info("Unsupported operating system.")
-        return False
-    
-    return True
-
-# Run the functions directly upon import
-if not is_libmagic_installed():
-    if install_libmagic():
-        logger.info("libmagic has been successfully installed.")
-    else:
-        logger.info("Failed to install libmagic.")
-else:
-    logger.info("libmagic is already installed. No action needed.")
\ No newline at end of file
+def check_system_dependencies():
+    """
+    Check that the binaries the upload processors shell out to are on PATH. They are
+    installed with the image (e.g. apt-get install --no-install-recommends ffmpeg
+    poppler-utils libmagic1), not at runtime; libmagic itself is checked by importing
+    python-magic.
+    """
+    if shutil.which("ffmpeg") is None:
+        raise RuntimeError("ffmpeg is not installed. Install it on the host or in the image to process audio and video uploads.")
+    if shutil.which("pdftoppm") is None:
+        logger.warning("Poppler (pdftoppm) is not installed; PDFs without a text layer cannot be processed.")
@@ -1,91 +1,67 @@
-from abc import ABC, abstractmethod
-from fastapi import APIRouter, File, UploadFile, Form, HTTPException, BackgroundTasks, Depends, Header
-from starlette.responses import FileResponse, StreamingResponse
-from moviepy.editor import VideoFileClip
-import tempfile
+from fastapi import APIRouter, HTTPException, Depends, Query
+from starlette.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from botocore.exceptions import ClientError, PaginationError
 import os
-import io
-import boto3
-import botocore
-import magic
-from enum import Enum
-from pdf2image import convert_from_path
-from ..config import logger, whisper_model, textract_client, aws_session
-from ..utils.embeddings import process_file
-from ..utils.auth import get_auth
+from typing import Optional
+from urllib.parse import quote
+from ..utils.auth import get_auth, get_token, get_s3_client
 
 router = APIRouter()
-s3_client = aws_session.client('s3')
+# Bytes read from the S3 response body per chunk sent to the client
+download_chunk_size = 64 * 1024
+# Most file keys returned by one list request, which is also the most S3 returns per call
+list_page_size = 1000
         
-async def get_token(authorization: str = Header(None)):
-    if authorization:
-        scheme, _, token = authorization.partition(' ')
-        if scheme.lower() == 'bearer':
-            return token
-    raise HTTPException(status_code=401, detail='Unauthorized')
-
 @router.get("/downloads/{username}/list")
-async def list_files(username: str, token: str = Depends(get_token), claims: dict = Depends(get_auth)):
+async def list_files(username: str, continuation_token: Optional[str] = Query(None), page_size: int = Query(list_page_size, gt=0, le=list_page_size), token: str = Depends(get_token), claims: dict = Depends(get_auth)):
+    """
+    Endpoint to list the user's uploaded files one page at a time.
+
+    Parameters:
+        continuation_token (str, optional): The next_token of the previous page; omit it for the first page.
+        page_size (int, optional): Number of keys to return, at most 1000. Default is 1000.
+
+    Returns:
+        dict: The page's S3 keys and the token for the next page, which is null after the last page.
+        Keys are in ascending key order, both within a page and across pages, so concatenating
+        pages in request order yields the full listing in ascending order.
+        Example:
+        {
+            "keys": ["private/<identity_id>/files/a.pdf", "private/<identity_id>/files/b.mp3"],
+            "next_token": "..."
+        }
+    """
     username = claims.get('cognito:username')
     subscription_level = claims.get('custom:subscription')
     if subscription_level != 'ProMonthly' and subscription_level != 'ProYearly':
         raise HTTPException(status_code=403, detail="You must have a Pro subscription to list files.")
-    try:
-        user_pool_id = os.getenv('AWS_USER_POOL_ID')
-        identity_pool_id = os.getenv('AWS_IDENTITY_POOL_ID')
-        login_provider = os.getenv('AWS_USER_POOL_CLIENT_ID')
-        region = os.getenv('AWS_COGNITO_REGION')
-        id_token = token
-        client = boto3.client('cognito-identity', region_name=region)
-        
-        # Get identity id for user
-        response = client.get_id(
-            IdentityPoolId=identity_pool_id,
-            Logins={
-                f'cognito-idp.{region}.amazonaws.com/{user_pool_id}': id_token
-            }
-        )
-        identity_id = response['IdentityId']
-        logger.info(f"Cognito Identity ID: {identity_id}")
-        # Get credentials for identity id
-        credentials_response = client.get_credentials_for_identity(
-            IdentityId=identity_id,
-            Logins={
-                f'cognito-idp.{region}.amazonaws.com/{user_pool_id}': id_token
-            }
-        )            
-        credentials = credentials_response['Credentials']
-        access_key = credentials['AccessKeyId']
-        secret_key = credentials['SecretKey']
-        session_token = credentials['SessionToken']
-        
-    except Exception as e:
-        logger.error(f"Unable to exchange token for temporary access key credentials: {str(e)}")
-        raise HTTPException(status_code=500, detail="Unable to exchange token for temporary access key credentials")
-
-    # Create a boto3 session with the temporary access key credentials
-    session = boto3.Session(
-        aws_access_key_id=access_key,
-        aws_secret_access_key=secret_key,
-        aws_session_token=session_token
-    )
-    logger.info(f"Temporary access key credentials created for {username}")
-    s3 = session.client('s3')
+    identity_id, s3 = await run_in_threadpool(get_s3_client, token)
     s3_bucket = os.getenv('AWS_USER_FILES_BUCKET')
     s3_prefix = f'private/{identity_id}/files/'
 
-    # List objects in the bucket with the prefix
+    # List one page of objects under the prefix, resuming from the token of the previous page
     paginator = s3.get_paginator('list_objects_v2')
-    pages = paginator.paginate(Bucket=s3_bucket, Prefix=s3_prefix)
+    pages = paginator.paginate(Bucket=s3_bucket, Prefix=s3_prefix, PaginationConfig={
+        'PageSize': page_size,
+        'MaxItems': page_size,
+        'StartingToken': continuation_token
+    })
+    try:
+        result = await run_in_threadpool(pages.build_full_result)
+    except (ValueError, PaginationError):
+        # botocore decodes the token before calling S3; a garbled or forged one fails here
+        raise HTTPException(status_code=400, detail="Invalid continuation_token")
+    except ClientError as error:
+        # A token that decodes but names no listing position is rejected by S3 itself
+        if continuation_token and error.response.get('Error', {}).get('Code') == 'InvalidArgument':
+            raise HTTPException(status_code=400, detail="Invalid continuation_token")
+        raise
 
-    # Collect all file keys and sort them in order of most recent
-    file_keys = []
-    for page in pages:
-        for obj in page['Contents']:
-            file_keys.append(obj['Key'])
-    file_keys.sort(key=lambda x: x.split('/')[-1], reverse=True)
+    # Keys stay in the ascending order S3 lists them in, so pages concatenate in order
+    file_keys = [obj['Key'] for obj in result.get('Contents', [])]
 
-    return file_keys
+    return {"keys": file_keys, "next_token": result.get('NextToken')}
 
 
 # In your download function:
@@ -95,57 +71,24 @@ async def upload(username: str, file_key: str, token: str = Depends(get_token),
     subscription_level = claims.get('custom:subscription')
     if subscription_level != 'ProMonthly' and subscription_level != 'ProYearly':
         raise HTTPException(status_code=403, detail="You must have a Pro subscription to upload files.")
-    try:
-        user_pool_id = os.getenv('AWS_USER_POOL_ID')
-        identity_pool_id = os.getenv('AWS_IDENTITY_POOL_ID')
-        login_provider = os.getenv('AWS_USER_POOL_CLIENT_ID')
-        region = os.getenv('AWS_COGNITO_REGION')
-        id_token = token
-        client = boto3.client('cognito-identity', region_name=region)
-        
-        # Get identity id for user
-        response = client.get_id(
-            IdentityPoolId=identity_pool_id,
-            Logins={
-                f'cognito-idp.{region}.amazonaws.com/{user_pool_id}': id_token
-            }
-        )
-        identity_id = response['IdentityId']
-        logger.info(f"Cognito Identity ID: {identity_id}")
-        # Get credentials for identity id
-        credentials_response = client.get_credentials_for_identity(
-            IdentityId=identity_id,
-            Logins={
-                f'cognito-idp.{region}.amazonaws.com/{user_pool_id}': id_token
-            }
-        )            
-        credentials = credentials_response['Credentials']
-        access_key = credentials['AccessKeyId']
-        secret_key = credentials['SecretKey']
-        session_token = credentials['SessionToken']
-        
-    except Exception as e:
-        logger.error(f"Unable to exchange token for temporary access key credentials: {str(e)}")
-        raise HTTPException(status_code=500, detail="Unable to exchange token for temporary access key credentials")
-
-    # Create a boto3 session with the temporary access key credentials
-    session = boto3.Session(
-        aws_access_key_id=access_key,
-        aws_secret_access_key=secret_key,
-        aws_session_token=session_token
-    )
-    logger.info(f"Temporary access key credentials created for {username}")
-    s3 = session.client('s3')
+    identity_id, s3 = await run_in_threadpool(get_s3_client, token)
     s3_bucket = os.getenv('AWS_USER_FILES_BUCKET')
     s3_key = f'private/{identity_id}/files/{file_key}'
 
-    # Download the file to a temporary file
-    with tempfile.NamedTemporaryFile(delete=False) as tmp:
-        s3.download_fileobj(s3_bucket, s3_key, tmp)
-        tmp_path = tmp.name
-
-    # Return the file as a StreamingResponse
-    return FileResponse(tmp_path, media_type='application/octet-stream', filename=file_key)
+    # Stream the object body to the client as S3 serves it, without staging it on disk
+    s3_object = await run_in_threadpool(s3.get_object, Bucket=s3_bucket, Key=s3_key)
+    # Quote the name the way FileResponse does, so non-latin-1 characters and quotes in a key
+    # still produce a valid header
+    quoted_file_key = quote(file_key)
+    if quoted_file_key != file_key:
+        content_disposition = f"attachment; filename*=utf-8''{quoted_file_key}"
+    else:
+        content_disposition = f'attachment; filename="{file_key}"'
+    headers = {
+        'Content-Disposition': content_disposition,
+        'Content-Length': str(s3_object['ContentLength'])
+    }
+    return StreamingResponse(s3_object['Body'].iter_chunks(chunk_size=download_chunk_size), media_type='application/octet-stream', headers=headers)
 
 @router.delete("/downloads/{username}/{file_key}")
 async def delete_file(username: str, file_key: str, token: str = Depends(get_token), claims: dict = Depends(get_auth)):
@@ -153,51 +96,11 @@ async def delete_file(username: str, file_key: str, token: str = Depends(get_tok
     subscription_level = claims.get('custom:subscription')
     if subscription_level != 'ProMonthly' and subscription_level != 'ProYearly':
         raise HTTPException(status_code=403, detail="You must have a Pro subscription to delete files.")
-    try:
-        user_pool_id = os.getenv('AWS_USER_POOL_ID')
-        identity_pool_id = os.getenv('AWS_IDENTITY_POOL_ID')
-        login_provider = os.getenv('AWS_USER_POOL_CLIENT_ID')
-        region = os.getenv('AWS_COGNITO_REGION')
-        id_token = token
-        client = boto3.client('cognito-identity', region_name=region)
-        
-        # Get identity id for user
-        response = client.get_id(
-            IdentityPoolId=identity_pool_id,
-            Logins={
-                f'cognito-idp.{region}.amazonaws.com/{user_pool_id}': id_token
-            }
-        )
-        identity_id = response['IdentityId']
-        logger.info(f"Cognito Identity ID: {identity_id}")
-        # Get credentials for identity id
-        credentials_response = client.get_credentials_for_identity(
-            IdentityId=identity_id,
-            Logins={
-                f'cognito-idp.{region}.amazonaws.com/{user_pool_id}': id_token
-            }
-        )            
-        credentials = credentials_response['Credentials']
-        access_key = credentials['AccessKeyId']
-        secret_key = credentials['SecretKey']
-        session_token = credentials['SessionToken']
-        
-    except Exception as e:
-        logger.error(f"Unable to exchange token for temporary access key credentials: {str(e)}")
-        raise HTTPException(status_code=500, detail="Unable to exchange token for temporary access key credentials")
-
-    # Create a boto3 session with the temporary access key credentials
-    session = boto3.Session(
-        aws_access_key_id=access_key,
-        aws_secret_access_key=secret_key,
-        aws_session_token=session_token
-    )
-    logger.info(f"Temporary access key credentials created for {username}")
-    s3 = session.client('s3')
+    identity_id, s3 = await run_in_threadpool(get_s3_client, token)
     s3_bucket = os.getenv('AWS_USER_FILES_BUCKET')
     s3_key = f'private/{identity_id}/files/{file_key}'
 
     # Delete the specified file
-    s3.delete_object(Bucket=s3_bucket, Key=s3_key)
+    await run_in_threadpool(s3.delete_object, Bucket=s3_bucket, Key=s3_key)
 
     return {"detail": "File successfully deleted"}
\ No newline at end of file
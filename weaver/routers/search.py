@@ -1,7 +1,5 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
-from pydantic import BaseModel, validator, Field
-import os
-import re
+from fastapi.responses import ORJSONResponse
 from typing import Optional
 import time
 from ..config import logger
@@ -12,6 +10,21 @@ router = APIRouter()
 
 # Define the model and the tokenizer
 top_k = 5  # Default value; adjust as needed
+def is_known(value):
+    return value is not None and value != "unknown"
+
+# (metadata key, response key, include check) for each field copied into a result; "unknown"
+# marks a missing value, and a link is only returned when there is one
+metadata_fields = (
+    ("Title", "Title", is_known),
+    ("URL", "Link", bool),
+    ("PublicationDate", "Published", is_known),
+    ("Author", "Author", is_known),
+    ("Tags", "Tags", is_known),
+    ("Filename", "Filename", is_known),
+    ("text", "embedding_text", is_known),
+    ("doc_id", "DocumentID", is_known),
+)
 
 @router.get("/search")
 def search(query: str = Query(..., min_length=1), results_to_return: Optional[int] = Query(top_k, gt=0), user_table: Optional[bool] = Query(False), claims: dict = Depends(get_auth)):
@@ -58,26 +71,12 @@ def search(query: str = Query(..., min_length=1), results_to_return: Optional[in
         results = []
         for result in top_results['matches']:
             metadata = result['metadata']
-            # Extract the Title and Link or file information from the metadata
-            link = metadata.get("URL", [])
+            # Copy each metadata field that is present to its response name, in response order
             result_data = {}
-
-            if metadata.get("Title", "unknown") != "unknown":
-                result_data["Title"] = metadata.get("Title")
-            if link:
-                result_data["Link"] = link
-            if metadata.get("PublicationDate", "unknown") != "unknown":
-                result_data["Published"] = metadata.get("PublicationDate")
-            if metadata.get("Author", "unknown") != "unknown":
-                result_data["Author"] = metadata.get("Author")
-            if metadata.get("Tags", "unknown") != "unknown":
-                result_data["Tags"] = metadata.get("Tags")
-            if metadata.get("Filename", "unknown") != "unknown":
-                result_data["Filename"] = metadata.get("Filename")
-            if metadata.get("text", "unknown") != "unknown":
-                result_data["embedding_text"] = metadata.get("text")
-            if metadata.get("doc_id", "unknown") != "unknown":
-                result_data["DocumentID"] = metadata.get("doc_id")
+            for metadata_key, result_key, include in metadata_fields:
+                value = metadata.get(metadata_key)
+                if include(value):
+                    result_data[result_key] = value
             result_data["similarity_score"] = round(result['score'], 2)
             results.append(result_data)
 
@@ -86,7 +85,9 @@ def search(query: str = Query(..., min_length=1), results_to_return: Optional[in
             "results": results
         }
 
-        return response
+        # Returning the response object directly skips FastAPI's jsonable_encoder pass over
+        # every result; the body is built from plain str/float values orjson encodes as-is
+        return ORJSONResponse(response)
 
     except Exception as e:
         logger.error(e)
@@ -1,20 +1,38 @@
 from abc import ABC, abstractmethod
-from fastapi import APIRouter, File, UploadFile, Form, HTTPException, BackgroundTasks, Depends, Header
-from moviepy.editor import VideoFileClip
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import APIRouter, File, UploadFile, Form, HTTPException, BackgroundTasks, Depends
+from starlette.concurrency import run_in_threadpool
+import asyncio
 import tempfile
+import shutil
+import subprocess
+import threading
 import os
 import io
-import boto3
-import botocore
+from boto3.s3.transfer import TransferConfig
 import magic
+import numpy as np
 from enum import Enum
-from pdf2image import convert_from_path
-from ..config import logger, whisper_model, textract_client, aws_session
+from pdf2image import convert_from_bytes
+from pypdf import PdfReader
+from pypdf.errors import PdfReadError
+from ..config import logger, get_whisper_model, whisper_batch_size, whisper_workers, get_client
 from ..utils.embeddings import process_file
-from ..utils.auth import get_auth
+from ..utils.auth import get_auth, get_token, get_s3_client
 
 router = APIRouter()
-s3_client = aws_session.client('s3')
+# Uploads that need a named file are staged on tmpfs when available, so the copy stays in memory;
+# TEMP_DIR overrides it where tmpfs is too small for large uploads (Docker gives /dev/shm 64 MiB)
+temp_dir = os.getenv('TEMP_DIR') or ('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir())
+# Stream uploads to S3 in 8 MiB parts, several at a time, instead of one buffered PUT
+s3_transfer_config = TransferConfig(multipart_threshold=8 * 1024 * 1024, multipart_chunksize=8 * 1024 * 1024, max_concurrency=4, use_threads=True)
+# One libmagic handle, loaded at import and shared by every processor
+mime_magic = magic.Magic(mime=True)
+# Textract calls in flight at once when OCRing the pages of one PDF
+textract_concurrency = 4
+# Transcription is compute-bound, so it runs on its own small pool rather than the shared
+# threadpool that serves every other blocking call in the app
+transcription_executor = ThreadPoolExecutor(max_workers=whisper_workers, thread_name_prefix="transcribe")
 
 class FileType(Enum):
     audio = "audio"
@@ -28,48 +46,129 @@ class FileProcessor(ABC):
     async def process(self, username, file: UploadFile, file_type: FileType):
         pass
 
-async def get_token(authorization: str = Header(None)):
-    if authorization:
-        scheme, _, token = authorization.partition(' ')
-        if scheme.lower() == 'bearer':
-            return token
-    raise HTTPException(status_code=401, detail='Unauthorized')
+def transcribe_audio(audio):
+    # audio is a file path or a 16 kHz mono float32 array; faster-whisper yields segments
+    # lazily, so decoding happens while they are joined
+    segments, _ = get_whisper_model().transcribe(audio, beam_size=1, batch_size=whisper_batch_size, vad_filter=True)
+    return "".join(segment.text for segment in segments)
+
+def extract_audio(video_path):
+    # Drop the video stream and pipe 16 kHz mono float32 PCM, the array Whisper works on, straight
+    # from ffmpeg's stdout instead of writing an intermediate audio file
+    result = subprocess.run(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", video_path, "-vn", "-ac", "1", "-ar", "16000", "-f", "f32le", "-"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
+    )
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+def extract_pdf_text(content):
+    # pypdf parses pages lazily, so only one page's text is held at a time alongside the joined
+    # result; scanned pages without a text layer contribute nothing
+    try:
+        reader = PdfReader(io.BytesIO(content))
+        return "\n".join(page.extract_text() or "" for page in reader.pages).strip()
+    except PdfReadError as error:
+        logger.warning(f"Unable to read PDF text layer: {error}")
+        return ""
+
+def extract_lines(response):
+    # Textract returns PAGE, LINE and WORD blocks; the LINE blocks carry the text in reading order
+    return [item["Text"] for item in response["Blocks"] if item["BlockType"] == "LINE"]
+
+def ocr_image(image):
+    # Encode the page as JPEG in memory rather than writing it to disk for Textract
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG')
+    response = get_client('textract').detect_document_text(Document={'Bytes': buffer.getvalue()})
+    return extract_lines(response)
+
+async def ocr_images(images):
+    # Pages are independent, so their Textract round-trips overlap, bounded to stay within
+    # the account's request rate; results come back in page order
+    semaphore = asyncio.Semaphore(textract_concurrency)
+
+    async def ocr_page(image):
+        async with semaphore:
+            return await run_in_threadpool(ocr_image, image)
+
+    return await asyncio.gather(*(ocr_page(image) for image in images))
+
+def decode_audio(file_obj):
+    # Feed the upload to ffmpeg on stdin and read 16 kHz mono float32 PCM from stdout, so the
+    # audio is decoded once without a temp file. Separate threads write stdin and drain stderr,
+    # so a flood of decode errors cannot fill the stderr pipe and stall ffmpeg
+    command = ["ffmpeg", "-loglevel", "error", "-i", "pipe:0", "-vn", "-ac", "1", "-ar", "16000", "-f", "f32le", "-"]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def feed():
+        try:
+            shutil.copyfileobj(file_obj, process.stdin, 1 << 20)
+        except BrokenPipeError:
+            # ffmpeg exited early; its exit code and stderr report why
+            pass
+        finally:
+            process.stdin.close()
+
+    stderr_chunks = []
+
+    def drain_stderr():
+        stderr_chunks.append(process.stderr.read())
+
+    writer = threading.Thread(target=feed, daemon=True)
+    reader = threading.Thread(target=drain_stderr, daemon=True)
+    writer.start()
+    reader.start()
+    pcm = process.stdout.read()
+    reader.join()
+    writer.join()
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, stderr=b"".join(stderr_chunks))
+    return np.frombuffer(pcm, dtype=np.float32)
 
 class AudioProcessor(FileProcessor):
     async def process(self, background_tasks: BackgroundTasks, username, file: UploadFile, file_type: FileType):
-        temp_file = tempfile.NamedTemporaryFile(delete=False)
-        content = file.file.read()
-        temp_file.write(content)
-        temp_file.close()
-        mime_type = magic.from_file(temp_file.name, mime=True)
+        # The header is enough for python-magic to identify the format
+        mime_type = mime_magic.from_buffer(await file.read(2048))
+        await file.seek(0)
         if mime_type != 'audio/mpeg':
             raise HTTPException(status_code=400, detail="Invalid file type. Please upload a valid audio file.")
-        result = whisper_model.transcribe(temp_file.name)
-        transcription_text = result['text']
         try:
-            doc_id, original_filename = process_file(username, {'Body': transcription_text}, file.filename, file_type)
+            audio = await run_in_threadpool(decode_audio, file.file)
+        except subprocess.CalledProcessError as error:
+            logger.error(f"Error decoding audio file: {error.stderr.decode(errors='replace').strip()}")
+            raise HTTPException(status_code=500, detail="Error decoding audio file")
+        doc_id, original_filename = await self.transcribe_and_process(username, audio, file.filename, file_type)
+        return {"success": "Audio processing started", "doc_id": doc_id, "original_filename": original_filename}
+
+    async def transcribe_and_process(self, username, audio, filename, file_type: FileType):
+        transcription_text = await asyncio.get_running_loop().run_in_executor(transcription_executor, transcribe_audio, audio)
+        try:
+            return await run_in_threadpool(process_file, username, {'Body': transcription_text}, filename, file_type)
         except ValueError as e:
             raise HTTPException(status_code=500, detail=str(e))
-        return {"success": "Audio processing started", "doc_id": doc_id, "original_filename": original_filename}
 
 
 class VideoProcessor(FileProcessor):
     async def process(self, background_tasks: BackgroundTasks, username, file: UploadFile, file_type: FileType):
-        temp_video_file = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False)
-        content = file.file.read()
-        temp_video_file.write(content)
-        temp_video_file.close()
-        mime_type = magic.from_file(temp_video_file.name, mime=True)
+        # The header is enough for python-magic to identify the format
+        mime_type = mime_magic.from_buffer(await file.read(2048))
+        await file.seek(0)
         if mime_type != 'video/mp4':
             raise HTTPException(status_code=400, detail="Invalid file type. Please upload a valid video file.")
-        video_clip = VideoFileClip(temp_video_file.name)
-        audio_clip = video_clip.audio
-        temp_audio_file = tempfile.NamedTemporaryFile(suffix=".mp3", delete=False)
-        audio_clip.write_audiofile(temp_audio_file.name)
-        temp_audio_file.close()
-        temp_audio_upload_file = UploadFile(filename=file.filename, file=open(temp_audio_file.name, 'rb'))
-        audio_processor = AudioProcessor()
-        await audio_processor.process(background_tasks, username, temp_audio_upload_file, file_type)
+        # ffmpeg needs a seekable input for MP4s whose index sits at the end of the file
+        with tempfile.NamedTemporaryFile(dir=temp_dir, suffix=".mp4") as temp_video_file:
+            try:
+                await run_in_threadpool(shutil.copyfileobj, file.file, temp_video_file, 1 << 20)
+                temp_video_file.flush()
+            except OSError as error:
+                logger.error(f"Error staging video file in {temp_dir}: {error}")
+                raise HTTPException(status_code=500, detail="Error staging video file")
+            try:
+                audio = await run_in_threadpool(extract_audio, temp_video_file.name)
+            except subprocess.CalledProcessError as error:
+                logger.error(f"Error extracting audio from video: {error.stderr.decode(errors='replace').strip()}")
+                raise HTTPException(status_code=500, detail="Error extracting audio from video")
+        await file_processors[FileType.audio].transcribe_and_process(username, audio, file.filename, file_type)
         return {"success": "Video processing started"}
 
 class ImageProcessor(FileProcessor):
@@ -81,69 +180,52 @@ class ImageProcessor(FileProcessor):
         content = await file.read()
         
         # Use python-magic to check mime type
-        mime_type = magic.from_buffer(content, mime=True)
+        mime_type = mime_magic.from_buffer(content)
         if mime_type not in ['image/jpeg', 'image/png', 'image/tiff']:
             raise HTTPException(status_code=400, detail="Invalid file type. Please upload a valid image file.")
         
         # Use Textract client to detect text in the image
-        response = textract_client.detect_document_text(Document={'Bytes': content})
+        response = await run_in_threadpool(get_client('textract').detect_document_text, Document={'Bytes': content})
         
         # Extract text from the response
-        text_content = ""
-        for item in response["Blocks"]:
-            if item["BlockType"] == "LINE":
-                text_content += item["Text"] + "\n"
+        text_content = "\n".join(extract_lines(response))
         
         # Process the extracted text
         try:
-            doc_id, original_filename = process_file(username, {'Body': text_content}, file.filename, file_type)
+            doc_id, original_filename = await run_in_threadpool(process_file, username, {'Body': text_content}, file.filename, file_type)
         except ValueError as e:
             raise HTTPException(status_code=500, detail=str(e))
         return {"success": "Image processing complete", "doc_id": doc_id, "original_filename": original_filename}
 
 class PDFProcessor(FileProcessor):
     async def process(self, background_tasks: BackgroundTasks, username, file: UploadFile, file_type: FileType):
-        temp_file = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+        # Textract, pypdf and pdf2image all accept the document in memory, so it is read once
         content = await file.read()
-        temp_file.write(content)
-        temp_file.close()
-        mime_type = magic.from_file(temp_file.name, mime=True)
+        mime_type = mime_magic.from_buffer(content[:2048])
         if mime_type != 'application/pdf':
             raise HTTPException(status_code=400, detail="Invalid file type. Please upload a valid PDF file.")
         text_content = ""
         try:
-            with open(temp_file.name, 'rb') as pdf_file:
-                response = textract_client.detect_document_text(Document={'Bytes': pdf_file.read()})
-            for item in response["Blocks"]:
-                if item["BlockType"] == "LINE":
-                    text_content += item["Text"] + "\n"
-        except textract_client.exceptions.UnsupportedDocumentException as error:
-            # If the PDF is not valid, convert the pages into images and process them as images
-            images = convert_from_path(temp_file.name)
-            image_files = []  # List to keep track of image files
-            for i, image in enumerate(images):
-                image_filename = f'{file.filename}_{i}.jpg'
-                image.save(image_filename, 'JPEG')
-                image_files.append(image_filename)  # Add the image file to the list
+            response = await run_in_threadpool(get_client('textract').detect_document_text, Document={'Bytes': content})
+            text_content = "\n".join(extract_lines(response))
+        except get_client('textract').exceptions.UnsupportedDocumentException as error:
+            # Synchronous Textract only accepts single-page documents, so multi-page PDFs land
+            # here; use their embedded text layer and only OCR the pages when there is none
+            text_content = await run_in_threadpool(extract_pdf_text, content)
+            if not text_content:
+                # If the PDF has no text layer, convert the pages into images and process them as images
+                images = await run_in_threadpool(convert_from_bytes, content)
                 try:
-                    with open(image_filename, 'rb') as image_file:
-                        response = textract_client.detect_document_text(Document={'Bytes': image_file.read()})
-                        for item in response["Blocks"]:
-                            if item["BlockType"] == "LINE":
-                                text_content += item["Text"] + "\n\n"
+                    pages = await ocr_images(images)
                 except Exception as error:
                     logger.error(f"Error processing image file: {error}")
                     raise HTTPException(status_code=500, detail="Error processing image file")
-                finally:
-                    # Delete the image file
-                    os.remove(image_filename)
-            # Delete the temporary PDF file
-            os.remove(temp_file.name)
+                text_content = "\n\n".join(line for page in pages for line in page)
         except Exception as error:
             logger.error(f"Unexpected error: {error}")
             raise HTTPException(status_code=500, detail="Unexpected error processing PDF file")
         try:
-            doc_id, original_filename = process_file(username, {'Body': text_content}, file.filename, file_type)
+            doc_id, original_filename = await run_in_threadpool(process_file, username, {'Body': text_content}, file.filename, file_type)
         except ValueError as e:
             raise HTTPException(status_code=500, detail=str(e))
         return {"success": "PDF processing complete", "doc_id": doc_id, "original_filename": original_filename}
@@ -151,30 +233,24 @@ class PDFProcessor(FileProcessor):
 class TextProcessor(FileProcessor):
     async def process(self, background_tasks: BackgroundTasks, username, file: UploadFile, file_type: FileType):
         text_content = (await file.read()).decode()
-        mime_type = magic.from_buffer(text_content, mime=True)
+        mime_type = mime_magic.from_buffer(text_content)
         if mime_type != 'text/plain':
             raise HTTPException(status_code=400, detail="Invalid file type. Please upload a valid text file.")
         file_key = file.filename
         try:
-            doc_id, original_filename = process_file(username, {'Body': text_content}, file.filename, file_type)
+            doc_id, original_filename = await run_in_threadpool(process_file, username, {'Body': text_content}, file.filename, file_type)
         except ValueError as e:
             raise HTTPException(status_code=500, detail=str(e))
         return {"success": "Text processing complete", "doc_id": doc_id, "original_filename": original_filename}
 
-class FileProcessorFactory:
-    def get_processor(self, file_type: FileType) -> FileProcessor:
-        if file_type == FileType.audio:
-            return AudioProcessor()
-        elif file_type == FileType.video:
-            return VideoProcessor()
-        elif file_type == FileType.image:
-            return ImageProcessor()
-        elif file_type == FileType.pdf:
-            return PDFProcessor()
-        elif file_type == FileType.text:
-            return TextProcessor()
-        else:
-            raise HTTPException(status_code=400, detail=f"Invalid file type: {file_type}")
+# Processors hold no state, so one instance of each serves every upload
+file_processors = {
+    FileType.audio: AudioProcessor(),
+    FileType.video: VideoProcessor(),
+    FileType.image: ImageProcessor(),
+    FileType.pdf: PDFProcessor(),
+    FileType.text: TextProcessor(),
+}
         
 # In your upload function:
 @router.post("/upload")
@@ -187,52 +263,12 @@ async def upload(background_tasks: BackgroundTasks, file: UploadFile = File(...)
         file_type_enum = FileType(file_type)
     except ValueError:
         raise HTTPException(status_code=400, detail=f"Invalid file type: {file_type}")
-    try:
-        user_pool_id = os.getenv('AWS_USER_POOL_ID')
-        identity_pool_id = os.getenv('AWS_IDENTITY_POOL_ID')
-        login_provider = os.getenv('AWS_USER_POOL_CLIENT_ID')
-        region = os.getenv('AWS_COGNITO_REGION')
-        id_token = token
-        client = boto3.client('cognito-identity', region_name=region)
-        
-        # Get identity id for user
-        response = client.get_id(
-            IdentityPoolId=identity_pool_id,
-            Logins={
-                f'cognito-idp.{region}.amazonaws.com/{user_pool_id}': id_token
-            }
-        )
-        identity_id = response['IdentityId']
-        logger.info(f"Cognito Identity ID: {identity_id}")
-        # Get credentials for identity id
-        credentials_response = client.get_credentials_for_identity(
-            IdentityId=identity_id,
-            Logins={
-                f'cognito-idp.{region}.amazonaws.com/{user_pool_id}': id_token
-            }
-        )            
-        credentials = credentials_response['Credentials']
-        access_key = credentials['AccessKeyId']
-        secret_key = credentials['SecretKey']
-        session_token = credentials['SessionToken']
-        
-    except Exception as e:
-        logger.error(f"Unable to exchange token for temporary access key credentials: {str(e)}")
-        raise HTTPException(status_code=500, detail="Unable to exchange token for temporary access key credentials")
-
-    # Create a boto3 session with the temporary access key credentials
-    session = boto3.Session(
-        aws_access_key_id=access_key,
-        aws_secret_access_key=secret_key,
-        aws_session_token=session_token
-    )
-    logger.info(f"Temporary access key credentials created for {username}")
-    s3 = session.client('s3')
+    identity_id, s3 = await run_in_threadpool(get_s3_client, token)
     s3_bucket = os.getenv('AWS_USER_FILES_BUCKET')
     s3_key = f'private/{identity_id}/files/{file.filename}'
-    file_content = await file.read()  # Read the file content into a variable
-    s3.upload_fileobj(io.BytesIO(file_content), s3_bucket, s3_key)  # Upload the file content to S3
-    file.file = io.BytesIO(file_content)  # Replace the file's file object with a new file object created from the file content
-    processor = FileProcessorFactory().get_processor(file_type_enum)
+    # Upload straight from the spooled upload file, then rewind it for the processor
+    await run_in_threadpool(s3.upload_fileobj, file.file, s3_bucket, s3_key, Config=s3_transfer_config)
+    await file.seek(0)
+    processor = file_processors[file_type_enum]
     result = await processor.process(background_tasks, username, file, file_type_enum)
     return result
\ No newline at end of file
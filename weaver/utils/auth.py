@@ -2,14 +2,18 @@ import json
 import logging
 import os
 import time
+import hashlib
+import threading
 import urllib.request
-from typing import Dict, List
+from functools import lru_cache
+from typing import Dict, List, Tuple
+import boto3
 from ..config import logger
 from jose import jwk, jwt
 from jose.utils import base64url_decode
 from pydantic import BaseModel
 from requests import get
-from fastapi import Request, Depends, HTTPException, status
+from fastapi import Request, Depends, Header, HTTPException, status
 
 class JWK(BaseModel):
     """A JSON Web Key (JWK) model that represents a cryptographic key.
@@ -211,6 +215,84 @@ class InvalidTokenUseError(CognitoError):
 def get_cognito_authenticator() -> CognitoAuthenticator:
     return CognitoAuthenticator()
 
+async def get_token(authorization: str = Header(None)):
+    if authorization:
+        scheme, _, token = authorization.partition(' ')
+        if scheme.lower() == 'bearer':
+            return token
+    raise HTTPException(status_code=401, detail='Unauthorized')
+
+# Temporary credentials exchanged from Cognito, keyed by a hash of the id token. An entry is
+# reused until it is within credentials_refresh_margin seconds of its expiration.
+credentials_refresh_margin = 30
+_credentials_cache: Dict[str, Tuple[str, str, str, str, float]] = {}
+_credentials_cache_lock = threading.Lock()
+
+@lru_cache(maxsize=None)
+def get_cognito_identity_client():
+    """Returns the cognito-identity client, built once and shared by every request."""
+    return boto3.client('cognito-identity', region_name=os.getenv('AWS_COGNITO_REGION'))
+
+@lru_cache(maxsize=128)
+def _get_s3_client(access_key: str, secret_key: str, session_token: str):
+    # Keyed by the credentials, so a user's requests share one client and its connection
+    # pool until Cognito issues them new credentials
+    session = boto3.Session(
+        aws_access_key_id=access_key,
+        aws_secret_access_key=secret_key,
+        aws_session_token=session_token
+    )
+    return session.client('s3')
+
+def get_s3_client(id_token: str) -> Tuple[str, object]:
+    """Exchange a Cognito id token for temporary AWS credentials and return the identity ID
+    together with an S3 client that uses them.
+
+    Args:
+        id_token: The user's Cognito id token
+    Returns:
+        A tuple of the Cognito identity ID and the S3 client
+    Raises:
+        HTTPException when the token cannot be exchanged
+    """
+    cache_key = hashlib.sha256(id_token.encode("utf-8")).hexdigest()
+    with _credentials_cache_lock:
+        entry = _credentials_cache.get(cache_key)
+    if entry is None or entry[4] - time.time() <= credentials_refresh_margin:
+        try:
+            user_pool_id = os.getenv('AWS_USER_POOL_ID')
+            identity_pool_id = os.getenv('AWS_IDENTITY_POOL_ID')
+            region = os.getenv('AWS_COGNITO_REGION')
+            client = get_cognito_identity_client()
+            logins = {f'cognito-idp.{region}.amazonaws.com/{user_pool_id}': id_token}
+
+            # Get identity id for user
+            response = client.get_id(IdentityPoolId=identity_pool_id, Logins=logins)
+            identity_id = response['IdentityId']
+            logger.info(f"Cognito Identity ID: {identity_id}")
+            # Get credentials for identity id
+            credentials = client.get_credentials_for_identity(IdentityId=identity_id, Logins=logins)['Credentials']
+            entry = (
+                identity_id,
+                credentials['AccessKeyId'],
+                credentials['SecretKey'],
+                credentials['SessionToken'],
+                credentials['Expiration'].timestamp()
+            )
+        except Exception as e:
+            logger.error(f"Unable to exchange token for temporary access key credentials: {str(e)}")
+            raise HTTPException(status_code=500, detail="Unable to exchange token for temporary access key credentials")
+        now = time.time()
+        with _credentials_cache_lock:
+            # Drop entries that can no longer be reused, so expired tokens do not accumulate
+            for key in [key for key, cached in _credentials_cache.items() if cached[4] - now <= credentials_refresh_margin]:
+                del _credentials_cache[key]
+            _credentials_cache[cache_key] = entry
+        logger.info(f"Temporary access key credentials created for {identity_id}")
+
+    identity_id, access_key, secret_key, session_token, _ = entry
+    return identity_id, _get_s3_client(access_key, secret_key, session_token)
+
 def get_auth(request: Request, authenticator: CognitoAuthenticator = Depends(get_cognito_authenticator)):
     auth_header = request.headers.get('Authorization')
     if auth_header:
@@ -0,0 +1,107 @@
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List
+
+
+class EncodeBatcher:
+    """Coalesces concurrent encode requests into batched encoder calls.
+
+    Callers block in encode() while a single background thread drains the queue,
+    waiting at most max_wait seconds to fill a batch of up to max_batch texts, runs
+    one encoder call for the whole batch and hands each caller its own row.
+    Requests for a single text, such as search queries, are taken ahead of texts
+    queued by larger requests.
+    """
+
+    def __init__(self, encoder: Callable[[List[str]], list], max_batch: int = 32, max_wait: float = 0.01) -> None:
+        self.encoder = encoder
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.PriorityQueue()
+        # Breaks ties between equal priorities so texts are taken in arrival order
+        self._sequence = itertools.count()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def encode(self, text: str):
+        """Queue a single text for encoding and wait for its embedding.
+
+        Args:
+            text: The exact string to embed, including any instruction prefix
+        Returns:
+            The embedding for the text
+        Raises:
+            Whatever the encoder raised for the batch the text was part of
+        """
+        return self.encode_many([text])[0]
+
+    def encode_many(self, texts: List[str]) -> list:
+        """Queue several texts for encoding and wait for all of their embeddings.
+
+        The texts are batched together with whatever else is queued, so large
+        uploads and single queries share forward passes instead of competing. A
+        single text is queued ahead of the texts of larger requests, so a query
+        that arrives during an upload waits for at most the batch already running.
+
+        Args:
+            texts: The exact strings to embed, including any instruction prefix
+        Returns:
+            One embedding per text, in input order
+        Raises:
+            Whatever the encoder raised for a batch one of the texts was part of
+        """
+        self._ensure_started()
+        priority = 0 if len(texts) == 1 else 1
+        futures = []
+        for text in texts:
+            future = Future()
+            self._queue.put((priority, next(self._sequence), text, future))
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def _ensure_started(self) -> None:
+        # Started lazily so the worker thread belongs to the process that serves requests
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="encode-batcher", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        batch = []
+        try:
+            while True:
+                batch = [self._queue.get()[2:]]
+                deadline = time.monotonic() + self.max_wait
+                while len(batch) < self.max_batch:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=timeout)[2:])
+                    except queue.Empty:
+                        break
+
+                try:
+                    embeddings = self.encoder([text for text, _ in batch])
+                except Exception as e:
+                    for _, future in batch:
+                        future.set_exception(e)
+                    continue
+                for (_, future), embedding in zip(batch, embeddings):
+                    future.set_result(embedding)
+                batch = []
+        finally:
+            # Anything else stopping the worker must not leave callers waiting forever
+            error = RuntimeError("The encode batcher worker stopped")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            while True:
+                try:
+                    future = self._queue.get_nowait()[3]
+                except queue.Empty:
+                    break
+                future.set_exception(error)
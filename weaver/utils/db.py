@@ -1,10 +1,13 @@
-from ..config import model, idx, user_idx, logger
+from ..config import encode_cached, get_index, PINECONE_INDEX_NAME, PINECONE_USER_INDEX_NAME, logger
 import numpy as np
 import json
+
+# Number of vectors sent per upsert request; keeps each request under Pinecone's payload limit
+upsert_batch_size = 100
     
 def batch_insert_into_pinecone(file_key, username, records):
     try:
-        user_idx.upsert(records, namespace=username)
+        get_index(PINECONE_USER_INDEX_NAME).upsert(records, namespace=username, batch_size=upsert_batch_size, show_progress=False)
         logger.info(f"Successfully batch inserted {len(records)} records")
     except Exception as e:
         with open("errors.txt", "a+") as error_file:  # Open "errors.txt" in append mode
@@ -17,12 +20,12 @@ def vector_query(query, results_to_return, username=None):
     try:
         instruction = "query:"
         query_string = f"{instruction} {query}"
-        query_vector = model.encode([query_string])[0].tolist()
+        query_vector = encode_cached([query_string])[0].tolist()
         if username is not None:
-            top_results = user_idx.query(query_vector, top_k=results_to_return, include_metadata=True, namespace=username)
+            top_results = get_index(PINECONE_USER_INDEX_NAME).query(query_vector, top_k=results_to_return, include_metadata=True, namespace=username)
             logger.info(f"Queried User Index for {username}")
         else:
-            top_results = idx.query(query_vector, top_k=results_to_return, include_metadata=True)
+            top_results = get_index(PINECONE_INDEX_NAME).query(query_vector, top_k=results_to_return, include_metadata=True)
         return top_results
     except Exception as e:
         logger.error(f"An error occurred while querying the database: {e}")
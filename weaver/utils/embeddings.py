@@ -1,10 +1,16 @@
 import os
+from itertools import islice
 from ksuid import ksuid
 from datetime import datetime
 import numpy as np
 from nltk.tokenize import sent_tokenize
-from ..config import logger, model, tokenizer
-from ..utils.db import batch_insert_into_pinecone
+from ..config import logger, get_tokenizer, encode_cached
+from ..utils.db import batch_insert_into_pinecone, upsert_batch_size
+
+try:
+    from blingfire import text_to_sentences
+except ImportError:
+    text_to_sentences = None
 
 def validate_date(date_str: str, format: str = "%Y-%m-%d") -> str:
     try:
@@ -13,25 +19,66 @@ def validate_date(date_str: str, format: str = "%Y-%m-%d") -> str:
     except ValueError:
         return ""
 
-def prepare_record_for_upsert(file_key, header, chunk_no, embeddings, embeddings_text):
+def split_sentences(text):
+    """
+    Split text into sentences, using blingfire's native splitter when installed and NLTK Punkt otherwise.
+    """
+    if text_to_sentences is not None:
+        return [sentence for sentence in text_to_sentences(text).split('\n') if sentence]
+    return sent_tokenize(text)
+
+def iter_chunks(sentences, sentence_lengths, max_chunk_size=256):
+    """
+    Yield the text of each chunk as soon as the next sentence would push it past max_chunk_size tokens.
+
+    Parameters:
+        sentences (list): The sentences of the document, in order.
+        sentence_lengths (list): The token count of each sentence.
+        max_chunk_size (int): The token budget of a chunk; a single longer sentence becomes its own chunk.
+    """
+    chunk = []
+    num_tokens = 0
+    for sentence, sentence_length in zip(sentences, sentence_lengths):
+        if chunk and num_tokens + sentence_length > max_chunk_size:
+            yield ' '.join(chunk)
+            chunk = [sentence]
+            num_tokens = sentence_length
+        else:
+            chunk.append(sentence)
+            num_tokens += sentence_length
+    if chunk:
+        yield ' '.join(chunk)
+
+def prepare_file_metadata(file_key, header):
+    """
+    Build the metadata fields shared by every chunk of a file, so they are computed once per file.
+    """
+    base_doc_id = header.get('doc_id', None)
+    publication_date_raw = header.get('PublicationDate', None)
+    if isinstance(publication_date_raw, list):
+        publication_date_raw = publication_date_raw[0]
+    publication_date = validate_date(str(publication_date_raw))
+    return {
+        "Filename": file_key if file_key else "unknown",
+        "PublicationDate": publication_date if publication_date else datetime.now().strftime("%Y-%m-%d"),
+        "doc_id": base_doc_id if base_doc_id else "unknown"
+    }
+
+def prepare_record_for_upsert(file_key, header, chunk_no, embeddings, embeddings_text, file_metadata=None):
     try:
-        # Convert the embeddings to a numpy array
-        embeddings_array = np.array(embeddings)
-        # If the array is 2-D with a single row, flatten it to 1-D
-        if embeddings_array.ndim == 2 and embeddings_array.shape[0] == 1:
-            embeddings_array = embeddings_array.flatten()
+        # View the embedding as a flat float32 vector; rows from the encoder need no copy and
+        # a single-row 2-D array is flattened to 1-D
+        embeddings_array = np.asarray(embeddings, dtype=np.float32).reshape(-1)
         # Extract and validate metadata
+        if file_metadata is None:
+            file_metadata = prepare_file_metadata(file_key, header)
         base_title = os.path.splitext(file_key)[0]
         title = f"{base_title} Part {chunk_no}"
         base_doc_id = header.get('doc_id', None)
         doc_id = f"{base_doc_id}-{chunk_no}" if base_doc_id else ksuid()
-        publication_date_raw = header.get('PublicationDate', None)
-        if isinstance(publication_date_raw, list):
-            publication_date_raw = publication_date_raw[0]
-        publication_date = validate_date(str(publication_date_raw))
 
         # Validate types
-        if doc_id is None or not isinstance(embeddings_array.tolist(), list) or not isinstance(title, str):
+        if doc_id is None or embeddings_array.size == 0 or not isinstance(title, str):
             raise ValueError("Invalid data type")
 
         # Convert the numpy array to a Python list
@@ -40,10 +87,10 @@ def prepare_record_for_upsert(file_key, header, chunk_no, embeddings, embeddings
         # Prepare metadata
         metadata = {
             "Title": title if title else "unknown",
-            "Filename": file_key if file_key else "unknown",
-            "PublicationDate": publication_date if publication_date else datetime.now().strftime("%Y-%m-%d"),
+            "Filename": file_metadata["Filename"],
+            "PublicationDate": file_metadata["PublicationDate"],
             "text": embeddings_text if embeddings_text else "unknown",
-            "doc_id": base_doc_id if base_doc_id else "unknown"
+            "doc_id": file_metadata["doc_id"]
         }
 
         return (doc_id, embeddings_list, metadata)
@@ -56,67 +103,56 @@ def process_file(username, file_obj, file_key, file_type):
     Process a given file by tokenizing the content and dividing it into chunks, then generating a batch of records for upsert.
 
     Parameters:
-        file_obj (dict): The file object containing the content to be processed.
+        username (str): The user whose namespace the records are upserted into.
+        file_obj (dict): The file object containing the decoded text under 'Body'.
         file_key (str): The key associated with the file.
+        file_type (FileType): The type of the uploaded file.
 
     Returns:
-        tuple: A tuple containing two lists - the local corpus and the local corpus embeddings.
+        tuple: The document ID and the file key of the processed file.
 
-    Note:
-        - This function tokenizes the content, splits it into chunks, and processes each chunk.
-        - It also handles UnicodeDecodeErrors and prints error messages for corrupted files.
+    Raises:
+        ValueError: If no records could be prepared from the content.
     """
     logger.info(f"Started Processing: {file_key}")
     instruction = "passage:"
     doc_id = str(ksuid())
-    local_corpus = []
-    local_corpus_embeddings = []
-
-    # Decode the content and handle any UnicodeDecodeError
-    try:
-        body_content = file_obj['Body']
-    except UnicodeDecodeError:
-        logger.error(f"UnicodeDecodeError: {file_key}")
-        return local_corpus, local_corpus_embeddings
+    body_content = file_obj['Body']
     max_chunk_size = 256  # Adjust as needed
-    sentences = sent_tokenize(body_content)
-    chunks = []
-    chunk = []
-    num_tokens = 0
+    sentences = split_sentences(body_content)
     header = {"doc_id": doc_id, "file_key": file_key, "file_type": file_type}
-    # Tokenize the sentences and split them into chunks
-    for sentence in sentences:
-        sentence_tokens = tokenizer.tokenize(sentence)
-        if num_tokens + len(sentence_tokens) > max_chunk_size:
-            chunks.append(chunk)
-            chunk = [sentence]
-            num_tokens = len(sentence_tokens)
-        else:
-            chunk.append(sentence)
-            num_tokens += len(sentence_tokens)
-
-    if chunk:
-        chunks.append(chunk)
-
-    records_to_upsert = []
+    # Tokenize all sentences in one batched call; only the token counts are needed
+    sentence_lengths = []
+    if sentences:
+        encoded = get_tokenizer()(sentences, add_special_tokens=False, return_attention_mask=False, return_token_type_ids=False)
+        sentence_lengths = [len(ids) for ids in encoded['input_ids']]
+    file_metadata = prepare_file_metadata(file_key, header)
+    chunks = iter_chunks(sentences, sentence_lengths, max_chunk_size)
     chunk_no = 0
-    # Process the chunks and insert them into the database
-    for chunk in chunks:
-        chunk_no += 1
-        chunk_text = ' '.join(chunk)
-        chunk_embedding = model.encode([f"{instruction} {chunk_text}"])
-        # Prepare each record for upsert but do not upsert it yet
-        record = prepare_record_for_upsert(file_key, header, chunk_no, chunk_embedding, chunk_text)
-        if record is not None:
-            records_to_upsert.append(record)
-    # Check if records_to_upsert is empty or None
-    if not records_to_upsert:
+    records_upserted = 0
+    # Encode and upsert one window of chunks at a time, so only a window's embeddings are held in memory
+    while True:
+        window = list(islice(chunks, upsert_batch_size))
+        if not window:
+            break
+        window_embeddings = encode_cached([f"{instruction} {chunk_text}" for chunk_text in window])
+        records_to_upsert = []
+        for chunk_text, chunk_embedding in zip(window, window_embeddings):
+            chunk_no += 1
+            record = prepare_record_for_upsert(file_key, header, chunk_no, chunk_embedding, chunk_text, file_metadata)
+            if record is not None:
+                records_to_upsert.append(record)
+        if not records_to_upsert:
+            continue
+        # Batch upsert the window's records
+        try:
+            batch_insert_into_pinecone(file_key, username, records_to_upsert)
+        except Exception as e:
+            logger.error(f"An error occurred while inserting into Pinecone for {file_key}: {e}")
+            return str(e), None
+        records_upserted += len(records_to_upsert)
+    # Check if any records were upserted
+    if not records_upserted:
         logger.error(f"An error occurred while processing the file {file_key}: No records to upsert")
         raise ValueError(f"An error occurred while processing the file {file_key}: No records to upsert")
-    # Batch upsert records
-    try:
-        batch_insert_into_pinecone(file_key, username, records_to_upsert)
-    except Exception as e:
-        logger.error(f"An error occurred while inserting into Pinecone for {file_key}: {e}")
-        return str(e), None
     return doc_id, file_key
\ No newline at end of file